@@ -0,0 +1,186 @@
+import io
+import json
+import xml.etree.ElementTree
+
+import pytest
+
+import set_up_wind_hierarchy
+
+
+def speedtree_xml(objects: str) -> io.BytesIO:
+    return io.BytesIO(f'<SpeedTreeRaw><Objects>{objects}</Objects></SpeedTreeRaw>'.encode('utf-8'))
+
+
+@pytest.fixture(params=['lxml', 'xml.etree'])
+def xml_backend(request, monkeypatch):
+    if request.param == 'lxml':
+        if not set_up_wind_hierarchy._HAS_LXML:
+            pytest.skip("lxml is not installed")
+    else:
+        monkeypatch.setattr(set_up_wind_hierarchy, '_HAS_LXML', False)
+        monkeypatch.setattr(set_up_wind_hierarchy, 'etree', xml.etree.ElementTree)
+    return request.param
+
+
+@pytest.fixture(params=['numpy', 'fallback'])
+def bone_id_parser(request, monkeypatch):
+    if request.param == 'numpy':
+        if set_up_wind_hierarchy.np is None:
+            pytest.skip("numpy is not installed")
+    else:
+        monkeypatch.setattr(set_up_wind_hierarchy, 'np', None)
+    return set_up_wind_hierarchy.parse_bone_ids
+
+
+@pytest.mark.parametrize('text', ['', ' ', '\n\t\n', '\n    '])
+def test_parse_bone_ids_empty_block(bone_id_parser, text):
+    assert bone_id_parser(text) == set()
+
+
+def test_parse_bone_ids_skips_negative_and_invalid_values(bone_id_parser):
+    assert bone_id_parser(' 4 4\n-1 5 ') == {4, 5}
+    assert bone_id_parser('1 2 2 x -1 1.5 3') == {1, 2, 3}
+    assert bone_id_parser('1 99999999999999999999') == {1, 99999999999999999999}
+
+
+def test_whitespace_only_bone_id_block_adds_no_bones():
+    xml = speedtree_xml(
+        '<Object Name="Trunk_L1"><Vertices><BoneID>1 2</BoneID></Vertices></Object>'
+        '<Object Name="Branch_L2"><Vertices><BoneID>\n    </BoneID></Vertices></Object>'
+    )
+    _, level_bone_ids = set_up_wind_hierarchy.parse_speedtree_xml(xml)
+    assert set_up_wind_hierarchy.assign_bone_ids_to_levels(level_bone_ids) == {1: 1, 2: 1}
+
+
+def test_only_top_level_objects_and_their_first_bone_id_are_read():
+    xml = io.BytesIO(
+        b'<SpeedTreeRaw>'
+        b'<Objects>'
+        b'<Object Name="Trunk_L1"><Vertices><BoneID>1 2</BoneID><BoneID>50</BoneID></Vertices>'
+        b'<Vertices><BoneID>7</BoneID></Vertices></Object>'
+        b'<Object Name="Branch_L2"><Points><BoneID>60</BoneID></Points></Object>'
+        b'</Objects>'
+        b'<Materials><Object Name="Mat_L3"><Vertices><BoneID>50</BoneID></Vertices></Object></Materials>'
+        b'</SpeedTreeRaw>'
+    )
+    level_data, level_bone_ids = set_up_wind_hierarchy.parse_speedtree_xml(xml)
+    assert sorted(level_data) == [1, 2]
+    assert level_bone_ids == {1: {1, 2}, 2: set()}
+    assert set_up_wind_hierarchy.assign_bone_ids_to_levels(level_bone_ids) == {1: 1, 2: 1}
+
+
+def test_keep_objects_false_only_builds_level_unions():
+    objects = ('<Object Name="Trunk_L1"><Vertices><BoneID>1 2</BoneID></Vertices></Object>'
+               '<Object Name="Branch_L2"><Vertices><BoneID>2 3</BoneID></Vertices></Object>')
+    level_data, level_bone_ids = set_up_wind_hierarchy.parse_speedtree_xml(speedtree_xml(objects), keep_objects=False)
+    assert level_data == {}
+    assert level_bone_ids == set_up_wind_hierarchy.parse_speedtree_xml(speedtree_xml(objects))[1]
+
+
+def test_write_json_stream_layout():
+    groups = [{"bUseDualInfluence": False, "Influence": 1.0}]
+    stream = io.BytesIO()
+    set_up_wind_hierarchy.write_json_stream(stream, {
+        "Joints": iter([b'{"JointName":"Root","SimulationGroupIndex":0}']),
+        "SimulationGroups": groups,
+        "GustAttenuation": 0.25,
+    })
+    assert stream.getvalue().decode('utf-8') == (
+        '{\n'
+        '  "Joints": [\n'
+        '    {"JointName":"Root","SimulationGroupIndex":0}\n'
+        '  ],\n'
+        '  "SimulationGroups": [\n'
+        '    {\n'
+        '      "bUseDualInfluence": false,\n'
+        '      "Influence": 1.0\n'
+        '    }\n'
+        '  ],\n'
+        '  "GustAttenuation": 0.25\n'
+        '}\n'
+    )
+
+
+def test_generate_wind_hierarchy_json_reports_write_failure(tmp_path):
+    assert set_up_wind_hierarchy.generate_wind_hierarchy_json([(1, 1)], str(tmp_path / 'wind.json'))
+    assert not set_up_wind_hierarchy.generate_wind_hierarchy_json([(1, 1)], str(tmp_path))
+    assert not set_up_wind_hierarchy.generate_wind_hierarchy_json([], str(tmp_path / 'empty.json'))
+
+
+def test_batch_generate_rejects_colliding_output_names(tmp_path):
+    with pytest.raises(ValueError, match='same JSON file'):
+        set_up_wind_hierarchy.batch_generate(['a/tree.xml', 'b/tree.xml', 'c/other.xml'], str(tmp_path / 'out'))
+    assert not (tmp_path / 'out').exists()
+
+
+class SingleEOFStringIO(io.StringIO):
+    """Text stream that fails instead of hanging when read again after returning ''"""
+    
+    def read(self, size=-1):
+        assert not getattr(self, 'at_eof', False), "read() called again after EOF"
+        text = super().read(size)
+        self.at_eof = not text
+        return text
+
+
+def test_parse_text_stream(xml_backend, tmp_path):
+    objects = '<Object Name="Trunk_L1"><Vertices><BoneID>1 2</BoneID></Vertices></Object>'
+    document = f'<?xml version="1.0" encoding="UTF-8"?>\n<SpeedTreeRaw><Objects>{objects}</Objects></SpeedTreeRaw>'
+    assert set_up_wind_hierarchy.parse_speedtree_xml(SingleEOFStringIO(document))[1] == {1: {1, 2}}
+    
+    # Text mode file, as the original read_speedtree_file opened it
+    path = tmp_path / 'tree.xml'
+    path.write_text(document, encoding='utf-8')
+    with open(path, encoding='utf-8') as file:
+        assert set_up_wind_hierarchy.parse_speedtree_xml(file)[1] == {1: {1, 2}}
+
+
+def test_non_speedtree_root_is_rejected(xml_backend, tmp_path, capsys):
+    with pytest.raises(set_up_wind_hierarchy.NotSpeedTreeXMLError, match='<Foo>'):
+        set_up_wind_hierarchy.parse_speedtree_xml(io.BytesIO(b'<Foo><Objects/></Foo>'))
+    
+    path = tmp_path / 'foo.xml'
+    path.write_bytes(b'<Foo><Objects/></Foo>')
+    assert set_up_wind_hierarchy.read_speedtree_file(str(path)) == ({}, {})
+    assert "Not a SpeedTree XML file" in capsys.readouterr().out
+
+
+def test_read_speedtree_file_does_not_swallow_unrelated_value_errors(tmp_path, monkeypatch):
+    def broken_parse(source, keep_objects=True):
+        raise ValueError("unrelated")
+    monkeypatch.setattr(set_up_wind_hierarchy, 'parse_speedtree_xml', broken_parse)
+    with pytest.raises(ValueError, match='unrelated'):
+        set_up_wind_hierarchy.read_speedtree_file(str(tmp_path / 'tree.xml'))
+
+
+def test_parse_bone_ids_dense_and_sparse_ranges(bone_id_parser):
+    # Below and above _MAX_BINCOUNT_BONE_ID, counted with np.bincount and np.unique respectively
+    large_id = set_up_wind_hierarchy._MAX_BINCOUNT_BONE_ID + 1
+    assert bone_id_parser('3 0 3 -1 7') == {0, 3, 7}
+    assert bone_id_parser(f'3 {large_id} 3 -1 {large_id}') == {3, large_id}
+
+
+def test_batch_generate_writes_each_file_and_skips_bad_ones(tmp_path, capsys):
+    objects = '<Object Name="Trunk_L1"><Vertices><BoneID>1 2</BoneID></Vertices></Object>'
+    (tmp_path / 'tree_a.xml').write_text(f'<SpeedTreeRaw><Objects>{objects}</Objects></SpeedTreeRaw>')
+    (tmp_path / 'tree_b.xml').write_text(f'<SpeedTreeRaw><Objects>{objects}</Objects></SpeedTreeRaw>')
+    (tmp_path / 'bad.xml').mkdir()  # Reading a directory raises an OSError in the worker
+    xml_paths = [str(tmp_path / name) for name in ('tree_a.xml', 'bad.xml', 'tree_b.xml')]
+    out_dir = tmp_path / 'out'
+    
+    written = set_up_wind_hierarchy.batch_generate(xml_paths, str(out_dir), workers=2)
+    
+    assert written == [str(out_dir / 'tree_a_wind_hierarchy.json'), str(out_dir / 'tree_b_wind_hierarchy.json')]
+    assert sorted(path.name for path in out_dir.iterdir()) == ['tree_a_wind_hierarchy.json',
+                                                                'tree_b_wind_hierarchy.json']
+    for path in written:
+        with open(path, encoding='utf-8') as file:
+            joints = json.load(file)["Joints"]
+        assert [joint["JointName"] for joint in joints] == ["Root", "Bone_1_Start", "Bone_1_End",
+                                                            "Bone_2_Start", "Bone_2_End"]
+    
+    # Output is grouped per file, in input order
+    output = capsys.readouterr().out
+    positions = [output.index(f"{xml_path}:") for xml_path in xml_paths]
+    assert positions == sorted(positions)
+    assert f"Error processing {xml_paths[1]}" in output